@@ -20,12 +20,16 @@
 # - https://docs.circuitpython.org/projects/display_text/en/latest/api.html
 # - https://learn.adafruit.com/circuitpython-display_text-library?view=all
 #
+from array import array
+from bitmaptools import arrayblit
 import board
 from digitalio import DigitalInOut, Direction
 from displayio import Bitmap, Group, Palette, TileGrid, release_displays
 from fourwire import FourWire
 import gc
 from micropython import const
+import supervisor
+import sys
 from terminalio import FONT
 import time
 
@@ -33,6 +37,12 @@ from adafruit_display_text import bitmap_label
 from adafruit_st7789 import ST7789
 
 
+# Status label and serial prompt templates, built once at import
+STATUS_WAITING = 'CHECK SERIAL CONSOLE\n%s'
+STATUS_PRESET = 'Gamma curve preset: %s\n%s'
+PROMPT = '%-8s [%s]: '
+
+
 class GammaCurve:
 
     # Preset 7-point calibration curves for some common gamma profiles. Some of
@@ -46,12 +56,16 @@ class GammaCurve:
         "P3":      (  0,  255,  185, 135,  97,   71,   51,   36,    27),
         "tft":     (  0,  255,  184, 131,  94,   68,   50,   36,    28),
     }
+    POINTS = len(PRESETS["Feather"])  # number of gray points in each curve
+
+    # 24-bit RGB color for each 8-bit gray value, precomputed at class load
+    GRAY24 = tuple(n * 0x010101 for n in range(256))
 
     def __init__(self):
         # Initialize the gamma curve test pattern
-        palette_size = len(list(self.PRESETS.values())[0])
-        self.palette = Palette(palette_size)
-        self.bars = palette_size - 2         # omit black, omit white
+        self.palette = Palette(self.POINTS)
+        self.curve = array('B', bytes(self.POINTS))  # 8-bit gray values
+        self.bars = self.POINTS - 2          # omit black, omit white
         self.load_preset("Feather")
 
     def preset_help(self):
@@ -67,42 +81,63 @@ class GammaCurve:
         if not name in self.PRESETS:
             return False
         self.preset = name
-        self.curve = list(self.PRESETS[name])
+        curve = self.curve
+        for (i, gray) in enumerate(self.PRESETS[name]):
+            curve[i] = gray                  # reuse the array, don't realloc
         self._update_palette()
         self.selection = self.WHITE + 1  # start at index for 1/2 brightness
+        self._text = None
         return True
 
     def _update_palette(self):
         # Update 24-bit colors in palette to match 8-bit gray values of curve.
+        gray24 = self.GRAY24
         for (i, gray) in enumerate(self.curve):
-            self.palette[i] = (gray << 16) | (gray << 8) | gray
+            self.palette[i] = gray24[gray]
 
     def set_gray(self, n):
         # Change the value of the currently selected 8-bit gray point.
         if not (0 < n < 255):
-            raise Exception(f"gray value is out of range: {n}")
+            raise ValueError("gray value is out of range")
+        old = self.curve[self.selection]
         self.curve[self.selection] = n
-        self._update_palette()
+        # The ST7789 is RGB565, so a gray only keeps its top 6 bits (green) and
+        # top 5 bits (red, blue). Skip palette writes that can't change the
+        # displayed color. Otherwise, write just the entry that changed.
+        if (old >> 2) != (n >> 2):
+            self.palette[self.selection] = self.GRAY24[n]
+        self._text = None
 
     def next_graypoint(self):
         # Select next graypoint, skipping first (white) and last (black).
         n = self.selection - 2
         self.selection = self.WHITE + 1 + ((n + 1) % self.bars)
+        self._text = None
 
     def prev_graypoint(self):
         # Select previous graypoint, skipping first (white) and last (black).
         n = self.selection - 2
         self.selection = self.WHITE + 1 + ((n - 1) % self.bars)
+        self._text = None
 
     def __str__(self):
         # Return printable string for this gamma curve (omit white and black).
+        # The string is cached until the curve or selection changes.
+        if self._text is not None:
+            return self._text
         s = self.selection
-        curve = self.curve
-        # build string with stars around current selected graypoint
-        left  = ''.join(['%03d   ' % n for n in curve[self.WHITE+1:s]])
-        sel   = '%03d<' % curve[s]
-        right = ''.join(['  %03d ' % n for n in curve[s+1:]])
-        return '%s%s%s' % (left, sel, right)
+        first = self.WHITE + 1
+        # build one format string with a marker after the selected graypoint,
+        # then fill in all the graypoints at once
+        left  = '%03d   ' * (s - first)
+        sel   = '%03d<'
+        right = '  %03d ' * (self.POINTS - 1 - s)
+        self._text = (left + sel + right) % tuple(self.curve[first:])
+        return self._text
+
+
+# The gamma curve object (including its palette) is allocated once at import
+GAMMA_CURVE = GammaCurve()
 
 
 def main():
@@ -116,9 +151,9 @@ def main():
     display = board.DISPLAY
     gc.collect()
 
-    # Make a gamma curve object which includes a .palette property which we
-    # will need for making a TileGrid later
-    gamma_curve = GammaCurve()
+    # Use the module's gamma curve object, which includes a .palette property
+    # which we will need for making a TileGrid later
+    gamma_curve = GAMMA_CURVE
 
     # Make a bitmap for the gamma calibration pattern
     #
@@ -146,28 +181,38 @@ def main():
     PAD = const(30)
     width = TFT_W
     height = TFT_H - PAD
-    bmp = Bitmap(width, height, len(gamma_curve.palette))
+    bmp = Bitmap(width, height, gamma_curve.POINTS)
     middle = height // 2
     number_of_bars = gamma_curve.bars
     px_per_bar = TFT_W // number_of_bars
-    for y in range(bmp.height):
-        for x in range(bmp.width // number_of_bars * number_of_bars):
-            # Select palette colors for the dither pattern based on the current
-            # x coordinate. Palette[0] is white, Palette[1] is the 1/2
-            # brightness gray value, Palette[2] is 1/4 brightness, etc.
-            which_vertical_bar = x // px_per_bar
-            # Dark dither color is always black
-            dark = gamma_curve.BLACK
-            # Light dither color is white for the leftmost bar. Then, for each
-            # bar to the right, it takes the value of the solid gray color from
-            # the previous (one step lighter/to-the-left) gray bar.
-            light = gamma_curve.WHITE + which_vertical_bar
-            solid = light + 1
-            if y < middle:
-                dither_light = (x ^ y) & 1
-                bmp[x, y] = light if dither_light else dark
-            else:
-                bmp[x, y] = solid
+    bars_width = px_per_bar * number_of_bars
+    # Build the three distinct rows of the pattern once, one bar at a time:
+    # two alternating checkerboard rows for the upper half, and a solid row for
+    # the lower half. Dark dither color is always black. Light dither color is
+    # white for the leftmost bar, then the solid gray of the bar to the left.
+    dark = gamma_curve.BLACK
+    white = gamma_curve.WHITE
+    rows = (bytearray(bars_width), bytearray(bars_width))
+    (even, odd) = rows
+    solid = bytearray(bars_width)
+    for bar in range(number_of_bars):
+        x = bar * px_per_bar
+        light = white + bar
+        # checkerboard phase follows (x ^ y) & 1, so odd x starts with light
+        tile = bytes((light, dark) if x & 1 else (dark, light))
+        tile *= px_per_bar // 2 + 1
+        even[x:x + px_per_bar] = tile[:px_per_bar]
+        odd[x:x + px_per_bar] = tile[1:px_per_bar + 1]
+        solid[x:x + px_per_bar] = bytes((light + 1,)) * px_per_bar
+    # Stack copies of the rows into one contiguous buffer for the whole bitmap,
+    # then blit it in one shot
+    buf = bytearray(bars_width * height)
+    mv = memoryview(buf)
+    for y in range(height):
+        row = solid if y >= middle else rows[y & 1]
+        mv[y * bars_width:(y + 1) * bars_width] = row
+    arrayblit(bmp, buf, 0, 0, bars_width, height)
+    del mv, buf  # main() never returns, so release the buffer explicitly
 
     # Combine the bitmap and palette into a TileGrid
     test_pattern = TileGrid(bmp, pixel_shader=gamma_curve.palette, x=0, y=PAD)
@@ -182,6 +227,11 @@ def main():
     grp.append(test_pattern)
     grp.append(status)
     display.root_group = grp
+    # Refresh manually, only when the event loop has changed something
+    display.auto_refresh = False
+
+    # Collect once now that the big init allocations are done
+    gc.collect()
 
     # MAIN EVENT LOOP
     help_message = """
@@ -201,38 +251,95 @@ Commands:
        ?  show this help message
 """ + gamma_curve.preset_help()
     print(help_message)
+    # Single letter commands, dispatched by one dict lookup per input line
+    commands = {
+        'n': gamma_curve.next_graypoint,    # "n" for next curve point
+        'p': gamma_curve.prev_graypoint,    # "p" for previous curve point
+        '?': lambda: print(help_message),   # "?" for help
+        '':  lambda: None,                  # ignore ""
+    }
     waiting_on_serial_input = True
+    last_curve_txt = None
+    line = ''          # serial input characters received so far
+    prev_c = ''        # previous serial input character (for CR LF pairs)
+    esc_len = 0        # characters seen so far of an escape sequence
+    need_prompt = True
     while True:
         curve_txt = str(gamma_curve)
         preset = gamma_curve.preset
-        if waiting_on_serial_input:
-            status.text = 'CHECK SERIAL CONSOLE\n%s' % curve_txt
-        else:
-            status.text = 'Gamma curve preset: %s\n%s' % (preset, curve_txt)
-        time.sleep(0.1)
+        # Only touch the label and refresh the display when the curve text
+        # changes, because setting status.text re-renders the label bitmap.
+        # Every palette change also invalidates the curve text, so this is
+        # the one place that needs to refresh.
+        if curve_txt is not last_curve_txt:
+            last_curve_txt = curve_txt
+            if waiting_on_serial_input:
+                status.text = STATUS_WAITING % curve_txt
+            else:
+                status.text = STATUS_PRESET % (preset, curve_txt)
+            display.refresh()
         # Prompt for a new grayscale value
-        ans = input(f'{preset:8} [{curve_txt}]: ')
-        waiting_on_serial_input = False
+        if need_prompt:
+            print(PROMPT % (preset, curve_txt), end='')
+            need_prompt = False
+        # Poll for serial input without blocking. Unlike input(), this lets
+        # the loop keep running while a line is only partially typed.
+        if not supervisor.runtime.serial_bytes_available:
+            time.sleep(0.02)
+            continue
+        c = sys.stdin.read(1)
+        crlf = (prev_c == '\r' and c == '\n')
+        prev_c = c
+        if crlf:
+            continue                            # LF of a CR LF line ending
+        if esc_len and c in ('\r', '\n'):
+            esc_len = 0                         # Enter always ends a line
+        elif esc_len:
+            # Skip escape sequences. CSI and SS3 sequences like arrow keys
+            # (ESC [ A, ESC O A) run up to their final letter or "~". Any other
+            # character after ESC (e.g. Alt+key) ends the sequence.
+            esc_len += 1
+            if esc_len == 2 and c not in ('[', 'O'):
+                esc_len = 0
+            elif esc_len > 2 and (c.isalpha() or c == '~'):
+                esc_len = 0
+            continue
+        if c == '\x1b':
+            esc_len = 1
+            continue
+        if c in ('\b', '\x7f'):                 # backspace
+            if line:
+                line = line[:-1]
+                print('\b \b', end='')
+            continue
+        if c not in ('\r', '\n'):
+            if c < ' ':
+                continue                        # ignore other control chars
+            line += c
+            print(c, end='')                    # echo, since stdin won't
+            continue
+        print()
+        (ans, line) = (line, '')
+        need_prompt = True
+        if waiting_on_serial_input:
+            waiting_on_serial_input = False
+            last_curve_txt = None  # force a status update for the new header
         try:
             n = int(ans)
-            if 0 < n < 255:
-                # If answer was an in-range grayscale value, change the value
-                gamma_curve.set_gray(n)
-            else:
-                print("gray value out of range")
         except ValueError as e:
-            if ans == 'n':                      # "n" for next curve point
-                gamma_curve.next_graypoint()
-            elif ans == 'p':                    # "p" for previous curve point
-                gamma_curve.prev_graypoint()
-            elif ans == '?':                    # "?" for help
-                print(help_message)
-            elif ans == '':                     # ignore ""
-                pass
+            command = commands.get(ans)
+            if command:
+                command()
             elif gamma_curve.load_preset(ans):  # load a gamma curve preset
                 pass
             else:
                 print('eh, what? (for help, try "?")')
+        else:
+            if 0 < n < 255:
+                # If answer was an in-range grayscale value, change the value
+                gamma_curve.set_gray(n)
+            else:
+                print("gray value out of range")
 
 
 main()